@@ -5,6 +5,50 @@ import numpy as np
 from typing import Dict, List, Tuple
 from datetime import datetime
 import os
+import tempfile
+
+# Delivery name -> stock name mapping shared by the auditor, engine and web app
+ITEM_MAPPING = {
+    'House Blend Coffee': 'Coffee Beans',
+    'Whole Milk': 'Milk',
+    '12oz Paper Cups': 'Paper Cups',
+    'Test Coffee': 'Coffee Beans',
+    'Test Milk': 'Milk',
+    'Vanilla Syrup': 'Sugar'  # Assuming syrup maps to sugar for simplification
+}
+
+
+def _build_delivery_aliases(mapping: Dict[str, str]) -> Dict[str, List[str]]:
+    """Invert a delivery -> stock name mapping into stock -> all delivery names."""
+    aliases = {}
+    for delivery_name, stock_name in mapping.items():
+        aliases.setdefault(stock_name, [stock_name]).append(delivery_name)
+    return aliases
+
+
+# Stock name -> every delivery name that counts toward it (including itself)
+DELIVERY_ALIASES = _build_delivery_aliases(ITEM_MAPPING)
+
+
+def make_temp_path(path: str) -> str:
+    """Create a uniquely named temp file next to path, so concurrent writers never share one."""
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    os.chmod(tmp_path, 0o644)  # mkstemp creates 0600; keep data files readable by other users
+    return tmp_path
+
+
+def write_csv_atomic(df: pd.DataFrame, path: str) -> None:
+    """Write a CSV via a temp file and rename so readers never see a partial file."""
+    tmp_path = make_temp_path(path)
+    try:
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 class InventoryAuditor:
     def __init__(self, data_dir: str = "data"):
@@ -46,14 +90,17 @@ class InventoryAuditor:
             'data_validation_errors': []
         }
         
-        # First validate data constraints
-        for idx, row in consumption_df.iterrows():
-            date = row['Date'].strftime('%Y-%m-%d')
-            item = row['Item_Name']
-            consumption = row['Consumption']
-            delivery = row['Delivery_Amount']
-            previous_stock = row['Previous_Stock']
-            stock_before = row['Stock_Before_Delivery']
+        # First validate data constraints; one vectorized mask picks out the rows
+        # with any negative value so only those are visited
+        checked_columns = ['Consumption', 'Delivery_Amount', 'Stock_Before_Delivery', 'Previous_Stock']
+        has_negative = (consumption_df[checked_columns] < 0).any(axis=1)
+        for row in consumption_df[has_negative].itertuples(index=False):
+            date = row.Date.strftime('%Y-%m-%d')
+            item = row.Item_Name
+            consumption = row.Consumption
+            delivery = row.Delivery_Amount
+            previous_stock = row.Previous_Stock
+            stock_before = row.Stock_Before_Delivery
             
             # Check for negative values (not allowed)
             if consumption < 0:
@@ -92,83 +139,77 @@ class InventoryAuditor:
                     'issue': 'Previous stock cannot be negative'
                 })
 
-        # Delivery name → stock name mapping (must stay in sync with inventory_engine.py)
-        item_mapping = {
-            'House Blend Coffee': 'Coffee Beans',
-            'Whole Milk': 'Milk',
-            '12oz Paper Cups': 'Paper Cups',
-            'Test Coffee': 'Coffee Beans',
-            'Test Milk': 'Milk',
-            'Vanilla Syrup': 'Sugar'
-        }
-
         # Group by item for sequential analysis
-        for item in consumption_df['Item_Name'].unique():
-            item_consumption = consumption_df[consumption_df['Item_Name'] == item].sort_values('Date')
-            item_stock = stock_df[stock_df['Item_Name'] == item].sort_values('Date')
+        stock_by_item = dict(tuple(stock_df.groupby('Item_Name', sort=False)))
+        no_stock = stock_df.iloc[0:0]
+        for item, item_consumption in consumption_df.groupby('Item_Name', sort=False):
+            item_consumption = item_consumption.sort_values('Date')
+            item_stock = stock_by_item.get(item, no_stock).sort_values('Date')
+            # First stock reading per date, so each consumption row is a dict lookup
+            first_stock = item_stock.drop_duplicates('Date')
+            stock_by_date = dict(zip(first_stock['Date'], first_stock['Current_Stock'].to_numpy()))
 
             # Gather deliveries including mapped delivery names
-            mapped_delivery_dfs = []
-            for delivery_name, stock_name in item_mapping.items():
-                if stock_name == item:
-                    mapped_delivery_dfs.append(deliveries_df[deliveries_df['Item_Name'] == delivery_name])
-            exact_match = deliveries_df[deliveries_df['Item_Name'] == item]
-            if not exact_match.empty:
-                mapped_delivery_dfs.append(exact_match)
-            item_deliveries = pd.concat(mapped_delivery_dfs, ignore_index=True).sort_values('Date') if mapped_delivery_dfs else pd.DataFrame(columns=deliveries_df.columns)
+            delivery_names = DELIVERY_ALIASES.get(item, [item])
+            item_deliveries = deliveries_df[deliveries_df['Item_Name'].isin(delivery_names)]
+            # Total delivered per date, built once so each lookup is a dict hit
+            delivery_totals = item_deliveries.groupby('Date')['Delivery_Amount'].sum()
+            delivery_by_date = dict(zip(delivery_totals.index, delivery_totals.to_numpy()))
 
-            # Check for stock increases not fully covered by deliveries
-            for i in range(1, len(item_stock)):
-                current_date = item_stock.iloc[i]['Date']
-                current_stock_val = item_stock.iloc[i]['Current_Stock']
-                previous_stock_val = item_stock.iloc[i-1]['Current_Stock']
-                stock_increase = current_stock_val - previous_stock_val
+            # Check for stock increases not fully covered by deliveries; day-over-day
+            # changes come from one np.diff and only the increases are visited
+            stock_dates = item_stock['Date'].tolist()
+            stock_values = item_stock['Current_Stock'].to_numpy(dtype=float)
+            stock_changes = np.diff(stock_values)
+            for i in np.flatnonzero(stock_changes > self.tolerance) + 1:
+                current_date = stock_dates[i]
+                current_stock_val = stock_values[i]
+                previous_stock_val = stock_values[i-1]
+                stock_increase = stock_changes[i-1]
 
-                if stock_increase > self.tolerance:
-                    delivery_on_date = item_deliveries[item_deliveries['Date'] == current_date]
-                    delivery_amount = delivery_on_date['Delivery_Amount'].sum() if not delivery_on_date.empty else 0
+                delivery_amount = delivery_by_date.get(current_date, 0)
 
-                    if delivery_amount < stock_increase - self.tolerance:
-                        if delivery_amount == 0:
-                            # No delivery recorded at all -- entire stock increase is unaccounted for
-                            issues['unrecorded_deliveries'].append({
-                                'date': current_date.strftime('%Y-%m-%d'),
-                                'item': item,
-                                'min_delivery': round(stock_increase, 2),
-                                'stock_increase': round(stock_increase, 2),
-                                'expected_stock': round(stock_increase, 2),
-                                'actual_stock': 0,
-                                'difference': round(stock_increase, 2),
-                                'note': f'Stock {round(previous_stock_val, 2)} -> {round(current_stock_val, 2)}',
-                                'issue': f'No delivery recorded but stock increased by {round(stock_increase, 2)}'
-                            })
-                        else:
-                            # Delivery exists but doesn't cover the full increase
-                            shortfall = round(stock_increase - delivery_amount, 2)
-                            issues['delivery_shortfalls'].append({
-                                'date': current_date.strftime('%Y-%m-%d'),
-                                'item': item,
-                                'stock_increase': round(stock_increase, 2),
-                                'delivery_amount': round(delivery_amount, 2),
-                                'shortfall': shortfall,
-                                'expected_stock': round(delivery_amount, 2),
-                                'actual_stock': round(stock_increase, 2),
-                                'difference': shortfall,
-                                'note': f'Stock +{round(stock_increase, 2)}, delivery {round(delivery_amount, 2)}',
-                                'issue': f'Stock increased by {round(stock_increase, 2)} but delivery was only {round(delivery_amount, 2)} (shortfall: {shortfall})'
-                            })
+                if delivery_amount < stock_increase - self.tolerance:
+                    if delivery_amount == 0:
+                        # No delivery recorded at all -- entire stock increase is unaccounted for
+                        issues['unrecorded_deliveries'].append({
+                            'date': current_date.strftime('%Y-%m-%d'),
+                            'item': item,
+                            'min_delivery': round(stock_increase, 2),
+                            'stock_increase': round(stock_increase, 2),
+                            'expected_stock': round(stock_increase, 2),
+                            'actual_stock': 0,
+                            'difference': round(stock_increase, 2),
+                            'note': f'Stock {round(previous_stock_val, 2)} -> {round(current_stock_val, 2)}',
+                            'issue': f'No delivery recorded but stock increased by {round(stock_increase, 2)}'
+                        })
+                    else:
+                        # Delivery exists but doesn't cover the full increase
+                        shortfall = round(stock_increase - delivery_amount, 2)
+                        issues['delivery_shortfalls'].append({
+                            'date': current_date.strftime('%Y-%m-%d'),
+                            'item': item,
+                            'stock_increase': round(stock_increase, 2),
+                            'delivery_amount': round(delivery_amount, 2),
+                            'shortfall': shortfall,
+                            'expected_stock': round(delivery_amount, 2),
+                            'actual_stock': round(stock_increase, 2),
+                            'difference': shortfall,
+                            'note': f'Stock +{round(stock_increase, 2)}, delivery {round(delivery_amount, 2)}',
+                            'issue': f'Stock increased by {round(stock_increase, 2)} but delivery was only {round(delivery_amount, 2)} (shortfall: {shortfall})'
+                        })
 
             # Check each consumption record
-            for idx, row in item_consumption.iterrows():
-                date = row['Date']
-                consumption = row['Consumption']
-                stock_before = row['Stock_Before_Delivery']
-                delivery_in_consumption = row['Delivery_Amount']
-                previous_stock = row['Previous_Stock']
+            for row in item_consumption.itertuples(index=False):
+                date = row.Date
+                consumption = row.Consumption
+                stock_before = row.Stock_Before_Delivery
+                delivery_in_consumption = row.Delivery_Amount
+                previous_stock = row.Previous_Stock
                 
                 # Find corresponding stock level
-                stock_record = item_stock[item_stock['Date'] == date]
-                if stock_record.empty:
+                current_stock = stock_by_date.get(date)
+                if current_stock is None:
                     issues['missing_stock_records'].append({
                         'date': date.strftime('%Y-%m-%d'),
                         'item': item,
@@ -176,11 +217,8 @@ class InventoryAuditor:
                     })
                     continue
                 
-                current_stock = stock_record.iloc[0]['Current_Stock']
-                
                 # Check if there's a delivery recorded in deliveries.csv for this date/item
-                delivery_record = item_deliveries[item_deliveries['Date'] == date]
-                actual_delivery = delivery_record['Delivery_Amount'].sum() if not delivery_record.empty else 0
+                actual_delivery = delivery_by_date.get(date, 0)
                 
                 # If there's a delivery in deliveries.csv but not in consumption data
                 if actual_delivery > 0 and delivery_in_consumption == 0:
@@ -368,7 +406,7 @@ class InventoryAuditor:
         
         # Save to CSV
         audit_df = pd.DataFrame(audit_records)
-        audit_df.to_csv(self.audit_results_file, index=False)
+        write_csv_atomic(audit_df, self.audit_results_file)
         
     def _get_issue_severity(self, issue_type: str) -> str:
         """Get severity level for issue type."""
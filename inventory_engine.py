@@ -9,7 +9,20 @@ import numpy as np
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional
 import os
-from audit_inventory import InventoryAuditor
+import threading
+from audit_inventory import InventoryAuditor, DELIVERY_ALIASES, write_csv_atomic
+
+# Columns the engine reads from each input file
+STOCK_COLUMNS = ['Date', 'Item_Name', 'Current_Stock']
+DELIVERY_COLUMNS = ['Date', 'Item_Name', 'Delivery_Amount', 'Notes']
+ITEM_INFO_COLUMNS = ['Item_Name', 'Unit', 'Min_Threshold', 'Max_Capacity', 'Lead_Time_Days', 'Cost_Per_Unit', 'Supplier', 'Notes']
+
+# Explicit dtypes for the text columns so pandas skips type inference on them
+TEXT_DTYPES = {'Item_Name': str, 'Unit': str, 'Supplier': str, 'Notes': str}
+
+def _is_stock_column(column: str) -> bool:
+    """usecols filter for the stock file; tolerates files missing some columns"""
+    return column in STOCK_COLUMNS
 
 class InventoryEngine:
     def __init__(self, data_dir: str = "data"):
@@ -21,91 +34,121 @@ class InventoryEngine:
         self.forecast_file = os.path.join(data_dir, "forecast_results.csv")
         self.recommendations_file = os.path.join(data_dir, "recommendations.csv")
         self.auditor = InventoryAuditor(data_dir)
+        # Parsed CSVs keyed by path, then by the read arguments; each entry is stored
+        # with the file version it came from
+        self._csv_cache: Dict[str, Dict[tuple, Tuple[tuple, pd.DataFrame]]] = {}
+        # Last status summary together with the input versions it was built from
+        self._status_cache: Optional[Tuple[tuple, Dict]] = None
+        # Serializes the passes that rewrite the derived CSVs, so web requests and
+        # the background recalculation never write them at the same time
+        self._write_lock = threading.RLock()
+    
+    def _save_csv(self, df: pd.DataFrame, path: str) -> None:
+        """Write a CSV via a temp file and rename so readers never see a partial file"""
+        write_csv_atomic(df, path)
+        self._csv_cache.pop(path, None)
+    
+    @staticmethod
+    def file_version(path: str) -> Optional[tuple]:
+        """Identify the on-disk version of a file, or None when it is missing"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    
+    def read_csv_cached(self, path: str, prepare=None, **read_kwargs) -> pd.DataFrame:
+        """
+        Read a CSV, reparsing only when its mtime, size or inode changes
+        prepare, if given, post-processes the parsed frame before it is cached
+        Frames are cached per path and per read arguments, so readers asking for
+        different columns or dtypes never share a parsed frame
+        """
+        version = self.file_version(path)
+        if version is None:
+            raise FileNotFoundError(path)  # Same contract as pd.read_csv
+        args_key = (prepare, repr(sorted(read_kwargs.items())))
+        path_cache = self._csv_cache.setdefault(path, {})
+        cached = path_cache.get(args_key)
+        if cached is None or cached[0] != version:
+            df = pd.read_csv(path, **read_kwargs)
+            cached = (version, prepare(df) if prepare else df)
+            path_cache[args_key] = cached
+        return cached[1].copy()
+    
+    @staticmethod
+    def _parse_dates_sorted(df: pd.DataFrame) -> pd.DataFrame:
+        """Parse the Date column and order rows by item then date"""
+        df['Date'] = pd.to_datetime(df['Date'])
+        return df.sort_values(['Item_Name', 'Date'])
     
     def load_stock_data(self) -> pd.DataFrame:
         """Load daily stock levels"""
         try:
-            df = pd.read_csv(self.stock_file)
-            df['Date'] = pd.to_datetime(df['Date'])
-            return df.sort_values(['Item_Name', 'Date'])
+            return self.read_csv_cached(self.stock_file, prepare=self._parse_dates_sorted,
+                                        usecols=_is_stock_column, dtype=TEXT_DTYPES)
         except FileNotFoundError:
-            return pd.DataFrame(columns=['Date', 'Item_Name', 'Current_Stock'])
+            return pd.DataFrame(columns=STOCK_COLUMNS)
     
     def load_delivery_data(self) -> pd.DataFrame:
         """Load delivery records"""
         try:
-            df = pd.read_csv(self.delivery_file)
-            df['Date'] = pd.to_datetime(df['Date'])
-            return df.sort_values(['Item_Name', 'Date'])
+            # All columns are kept: add_delivery_entry writes this frame back to the file
+            return self.read_csv_cached(self.delivery_file, prepare=self._parse_dates_sorted,
+                                        dtype=TEXT_DTYPES)
         except FileNotFoundError:
-            return pd.DataFrame(columns=['Date', 'Item_Name', 'Delivery_Amount', 'Notes'])
+            return pd.DataFrame(columns=DELIVERY_COLUMNS)
     
     def load_item_info(self) -> pd.DataFrame:
         """Load item metadata"""
         try:
-            return pd.read_csv(self.item_info_file)
+            return self.read_csv_cached(self.item_info_file, dtype=TEXT_DTYPES)
         except FileNotFoundError:
-            return pd.DataFrame(columns=['Item_Name', 'Unit', 'Min_Threshold', 'Max_Capacity', 'Lead_Time_Days', 'Cost_Per_Unit', 'Supplier', 'Notes'])
+            return pd.DataFrame(columns=ITEM_INFO_COLUMNS)
     
-    def calculate_daily_consumption(self) -> pd.DataFrame:
+    def calculate_daily_consumption(self, stock_df: Optional[pd.DataFrame] = None,
+                                    delivery_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
         Calculate daily consumption for each item
         Formula: consumption = previous_stock + deliveries - current_stock
+        Pass already loaded stock/delivery frames to avoid reloading them
         """
-        stock_df = self.load_stock_data()
-        delivery_df = self.load_delivery_data()
+        if stock_df is None:
+            stock_df = self.load_stock_data()
+        if delivery_df is None:
+            delivery_df = self.load_delivery_data()
         
         if stock_df.empty:
             return pd.DataFrame(columns=['Date', 'Item_Name', 'Consumption', 'Stock_Before_Delivery', 'Delivery_Amount', 'Previous_Stock', 'Reasoning'])
         
-        # Create item name mapping from delivery names to stock names
-        item_mapping = {
-            'House Blend Coffee': 'Coffee Beans',
-            'Whole Milk': 'Milk',
-            '12oz Paper Cups': 'Paper Cups',
-            'Test Coffee': 'Coffee Beans',
-            'Test Milk': 'Milk',
-            'Vanilla Syrup': 'Sugar'  # Assuming syrup maps to sugar for simplification
-        }
-        
         consumption_records = []
         
-        for item in stock_df['Item_Name'].unique():
-            item_stocks = stock_df[stock_df['Item_Name'] == item].copy()
-            
-            # Get deliveries for this item (accounting for name mapping)
-            mapped_deliveries = []
-            for delivery_name, stock_name in item_mapping.items():
-                if stock_name == item:
-                    item_deliveries = delivery_df[delivery_df['Item_Name'] == delivery_name].copy()
-                    mapped_deliveries.append(item_deliveries)
-            
-            # Also check for exact name matches
-            exact_deliveries = delivery_df[delivery_df['Item_Name'] == item].copy()
-            if not exact_deliveries.empty:
-                mapped_deliveries.append(exact_deliveries)
+        # Walk each item's stock history in date order
+        for item, item_stocks in stock_df.groupby('Item_Name', sort=False):
+            # Get deliveries for this item (exact name plus any mapped delivery names)
+            delivery_names = DELIVERY_ALIASES.get(item, [item])
+            all_deliveries = delivery_df[delivery_df['Item_Name'].isin(delivery_names)]
             
-            # Combine all deliveries for this item
-            all_deliveries = pd.concat(mapped_deliveries, ignore_index=True) if mapped_deliveries else pd.DataFrame()
-            
-            # Create delivery lookup (sum deliveries by date if multiple)
+            # Create delivery lookup (sum deliveries by date if multiple), keyed by
+            # day-normalized timestamps
             delivery_lookup = {}
             if not all_deliveries.empty:
-                delivery_by_date = all_deliveries.groupby(all_deliveries['Date'].dt.strftime('%Y-%m-%d'))['Delivery_Amount'].sum()
+                delivery_by_date = all_deliveries.groupby(all_deliveries['Date'].dt.normalize())['Delivery_Amount'].sum()
                 delivery_lookup = delivery_by_date.to_dict()
             
+            # Plain column lists for the per-day loop
+            dates = item_stocks['Date'].tolist()
+            days = item_stocks['Date'].dt.normalize().tolist()
+            stocks = item_stocks['Current_Stock'].tolist()
+            
             # Calculate consumption for each day (except first day)
-            for i in range(1, len(item_stocks)):
-                current_row = item_stocks.iloc[i]
-                previous_row = item_stocks.iloc[i-1]
-                
-                current_date = current_row['Date']
-                current_stock = current_row['Current_Stock']
-                previous_stock = previous_row['Current_Stock']
+            for i in range(1, len(stocks)):
+                current_date = dates[i]
+                current_stock = stocks[i]
+                previous_stock = stocks[i-1]
                 
                 # Get deliveries for current date
-                date_str = current_date.strftime('%Y-%m-%d')
-                delivery_amount = delivery_lookup.get(date_str, 0.0)
+                delivery_amount = delivery_lookup.get(days[i], 0.0)
                 
                 # Calculate consumption
                 # consumption = previous_stock + deliveries - current_stock
@@ -154,52 +197,70 @@ class InventoryEngine:
         
         # Save to CSV
         if not consumption_df.empty:
-            consumption_df.to_csv(self.consumption_file, index=False)
+            self._save_csv(consumption_df, self.consumption_file)
             print(f"✅ Saved {len(consumption_df)} consumption records to {self.consumption_file}")
         
         # Run audit after consumption calculation
         try:
-            audit_report = self.auditor.run_audit()
+            audit_report = self.run_audit()
             print(f"✅ Audit completed and saved to {self.auditor.audit_results_file}")
         except Exception as e:
             print(f"⚠️  Audit failed: {str(e)}")
         
         return consumption_df
     
-    def calculate_forecast(self, days_ahead: int = 30, lookback_days: int = 14) -> pd.DataFrame:
+    def calculate_forecast(self, days_ahead: int = 30, lookback_days: int = 14,
+                           consumption_df: Optional[pd.DataFrame] = None,
+                           stock_df: Optional[pd.DataFrame] = None,
+                           item_info_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
         Generate forecasts for each item
+        Pass a freshly calculated consumption_df to avoid recalculating it,
+        and already loaded stock/item info frames to avoid reloading them
         """
-        stock_df = self.load_stock_data()
-        consumption_df = self.calculate_daily_consumption()
-        item_info_df = self.load_item_info()
+        if stock_df is None:
+            stock_df = self.load_stock_data()
+        if consumption_df is None:
+            consumption_df = self.calculate_daily_consumption(stock_df=stock_df)
+        if item_info_df is None:
+            item_info_df = self.load_item_info()
         
         if stock_df.empty or consumption_df.empty:
             return pd.DataFrame()
         
         forecast_records = []
         today = datetime.now().date()
+
+        # Consumption dates are already datetime64, so they compare directly
+        # against Timestamp cutoffs
+        lookback_cutoff = pd.Timestamp(today - timedelta(days=lookback_days))
+        chart_cutoff = pd.Timestamp(today - timedelta(days=14))
+        
+        # Index item info by name once; the first row wins for duplicated names
+        info_by_name = item_info_df.drop_duplicates('Item_Name').set_index('Item_Name').to_dict('index')
+        
+        # Latest stock and consumption history, indexed by item
+        latest_stock = stock_df.drop_duplicates('Item_Name', keep='last').set_index('Item_Name')['Current_Stock'].to_dict()
+        consumption_by_item = dict(list(consumption_df.groupby('Item_Name', sort=False)))
+        no_consumption = consumption_df.iloc[0:0]
+        last_updated = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
         for item in stock_df['Item_Name'].unique():
             # Get current stock (most recent entry)
-            item_stocks = stock_df[stock_df['Item_Name'] == item]
-            current_stock = item_stocks.iloc[-1]['Current_Stock'] if not item_stocks.empty else 0
+            current_stock = latest_stock.get(item, 0)
             
             # Get item info
-            item_info = item_info_df[item_info_df['Item_Name'] == item]
-            min_threshold = item_info.iloc[0]['Min_Threshold'] if not item_info.empty else 0
-            max_capacity = item_info.iloc[0]['Max_Capacity'] if not item_info.empty else 100
-            lead_time = item_info.iloc[0]['Lead_Time_Days'] if not item_info.empty else 7
-            unit = item_info.iloc[0]['Unit'] if not item_info.empty else 'units'
+            item_info = info_by_name.get(item)
+            min_threshold = item_info['Min_Threshold'] if item_info is not None else 0
+            max_capacity = item_info['Max_Capacity'] if item_info is not None else 100
+            lead_time = item_info['Lead_Time_Days'] if item_info is not None else 7
+            unit = item_info['Unit'] if item_info is not None else 'units'
             
             # Calculate average consumption (last N days)
-            item_consumption = consumption_df[consumption_df['Item_Name'] == item]
+            item_consumption = consumption_by_item.get(item, no_consumption)
             
             # Get last N days of consumption
-            cutoff_date = today - timedelta(days=lookback_days)
-            recent_consumption = item_consumption[
-                pd.to_datetime(item_consumption['Date']).dt.date >= cutoff_date
-            ]
+            recent_consumption = item_consumption[item_consumption['Date'] >= lookback_cutoff]
 
             # Fall back to all available data if nothing in the lookback window
             using_stale_data = recent_consumption.empty and not item_consumption.empty
@@ -230,10 +291,7 @@ class InventoryEngine:
                 confidence = "Low"
             
             # Get consumption history for charts (last 14 days, or last 14 data points if data is older)
-            last_14_days = today - timedelta(days=14)
-            chart_data = item_consumption[
-                pd.to_datetime(item_consumption['Date']).dt.date >= last_14_days
-            ].copy()
+            chart_data = item_consumption[item_consumption['Date'] >= chart_cutoff].copy()
             if chart_data.empty and not item_consumption.empty:
                 chart_data = item_consumption.tail(14).copy()
             
@@ -254,38 +312,43 @@ class InventoryEngine:
                 'Confidence': confidence,
                 'Chart_Dates': '|'.join(chart_dates),
                 'Chart_Consumption': '|'.join(map(str, chart_consumption)),
-                'Last_Updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                'Last_Updated': last_updated
             })
         
         forecast_df = pd.DataFrame(forecast_records)
         
         # Save to CSV
         if not forecast_df.empty:
-            forecast_df.to_csv(self.forecast_file, index=False)
+            self._save_csv(forecast_df, self.forecast_file)
             print(f"✅ Saved {len(forecast_df)} forecast records to {self.forecast_file}")
         
         return forecast_df
     
-    def generate_recommendations(self, buffer_days: int = 1) -> pd.DataFrame:
+    def generate_recommendations(self, buffer_days: int = 1,
+                                 forecast_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
         Generate purchase recommendations with detailed explanations
+        Pass a freshly calculated forecast_df to avoid recalculating it
         """
-        forecast_df = self.calculate_forecast()
+        if forecast_df is None:
+            forecast_df = self.calculate_forecast()
         
         if forecast_df.empty:
             return pd.DataFrame()
         
         recommendations = []
+        # Every recommendation in a batch shares one timestamp
+        generated_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        for _, item in forecast_df.iterrows():
-            item_name = item['Item_Name']
-            current_stock = item['Current_Stock']
-            min_threshold = item['Min_Threshold']
-            max_capacity = item['Max_Capacity']
-            lead_time = item['Lead_Time_Days']
-            avg_consumption = item['Avg_Daily_Consumption']
-            days_remaining = item['Days_Remaining']
-            unit = item['Unit']
+        for item in forecast_df.itertuples(index=False):
+            item_name = item.Item_Name
+            current_stock = item.Current_Stock
+            min_threshold = item.Min_Threshold
+            max_capacity = item.Max_Capacity
+            lead_time = item.Lead_Time_Days
+            avg_consumption = item.Avg_Daily_Consumption
+            days_remaining = item.Days_Remaining
+            unit = item.Unit
             
             # Calculate recommended order quantity for ALL items
             # Target: 80% of max capacity
@@ -361,24 +424,55 @@ Reason: {urgency_reason}
                 'Target_Stock_Level': target_stock,
                 'Lead_Time_Days': lead_time,
                 'Avg_Daily_Usage': avg_consumption,
-                'Generated_Date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                'Generated_Date': generated_date
             })
         
         recommendations_df = pd.DataFrame(recommendations)
         
         # Save to CSV
         if not recommendations_df.empty:
-            recommendations_df.to_csv(self.recommendations_file, index=False)
+            self._save_csv(recommendations_df, self.recommendations_file)
             print(f"✅ Saved {len(recommendations_df)} recommendations to {self.recommendations_file}")
         
         return recommendations_df
     
+    def recalculate_all(self) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """
+        Recompute consumption, forecast and recommendations in one pass
+        Input files are loaded once and shared by every step
+        """
+        with self._write_lock:
+            stock_df = self.load_stock_data()
+            delivery_df = self.load_delivery_data()
+            item_info_df = self.load_item_info()
+            
+            consumption_df = self.calculate_daily_consumption(stock_df=stock_df, delivery_df=delivery_df)
+            forecast_df = self.calculate_forecast(consumption_df=consumption_df, stock_df=stock_df,
+                                                  item_info_df=item_info_df)
+            recommendations_df = self.generate_recommendations(forecast_df=forecast_df)
+        return consumption_df, forecast_df, recommendations_df
+    
     def get_current_status(self) -> Dict:
-        """Get current inventory status summary"""
+        """
+        Get current inventory status summary
+        The summary is reused until an input file changes or the day rolls over
+        """
+        key = (self.file_version(self.stock_file),
+               self.file_version(self.delivery_file),
+               self.file_version(self.item_info_file),
+               datetime.now().date())
+        # Rebuilding the summary rewrites the derived CSVs, so it takes the write lock
+        with self._write_lock:
+            if self._status_cache is None or self._status_cache[0] != key:
+                self._status_cache = (key, self._compute_current_status())
+            return dict(self._status_cache[1])
+    
+    def _compute_current_status(self) -> Dict:
+        """Build the status summary from the current input files"""
         stock_df = self.load_stock_data()
         item_info_df = self.load_item_info()
-        forecast_df = self.calculate_forecast()
-        recommendations_df = self.generate_recommendations()
+        forecast_df = self.calculate_forecast(stock_df=stock_df, item_info_df=item_info_df)
+        recommendations_df = self.generate_recommendations(forecast_df=forecast_df)
         
         if stock_df.empty:
             return {
@@ -388,19 +482,16 @@ Reason: {urgency_reason}
                 'recommendations_count': 0
             }
         
-        # Get latest stock for each item
-        latest_stocks = stock_df.groupby('Item_Name').last()
+        # Get latest stock for each item (rows are sorted by item then date)
+        latest_stocks = stock_df.drop_duplicates('Item_Name', keep='last').set_index('Item_Name')
         
         # Count items below threshold
         items_below_threshold = 0
         if not item_info_df.empty:
-            for item_name in latest_stocks.index:
-                current_stock = latest_stocks.loc[item_name, 'Current_Stock']
-                item_info = item_info_df[item_info_df['Item_Name'] == item_name]
-                if not item_info.empty:
-                    min_threshold = item_info.iloc[0]['Min_Threshold']
-                    if current_stock <= min_threshold:
-                        items_below_threshold += 1
+            # Align each item's threshold with its latest stock and compare in one mask
+            min_thresholds = item_info_df.drop_duplicates('Item_Name').set_index('Item_Name')['Min_Threshold']
+            aligned_thresholds = min_thresholds.reindex(latest_stocks.index)
+            items_below_threshold = int((latest_stocks['Current_Stock'] <= aligned_thresholds).sum())
         
         # Count critical items (recommendations with CRITICAL urgency)
         critical_items = 0
@@ -416,32 +507,40 @@ Reason: {urgency_reason}
         }
     
     
+    def run_audit(self) -> str:
+        """Run the consistency audit; it rewrites audit_results.csv, so it takes the write lock"""
+        with self._write_lock:
+            return self.auditor.run_audit()
+    
     def add_delivery_entry(self, date: str, item_name: str, delivery_amount: float, notes: str = "") -> bool:
         """Add a new delivery entry"""
         try:
-            delivery_df = self.load_delivery_data()
-            
-            # Create new entry
-            new_entry = pd.DataFrame({
-                'Date': [pd.to_datetime(date)],
-                'Item_Name': [item_name],
-                'Delivery_Amount': [delivery_amount],
-                'Notes': [notes]
-            })
-            
-            # Add new entry
-            delivery_df = pd.concat([delivery_df, new_entry], ignore_index=True)
-            delivery_df = delivery_df.sort_values(['Item_Name', 'Date'])
-            
-            # Save
-            delivery_df.to_csv(self.delivery_file, index=False)
-            
-            # Recalculate everything
-            self.calculate_daily_consumption()
-            self.calculate_forecast()
-            self.generate_recommendations()
-            
-            return True
+            # Reading, rewriting and recalculating happen as one step under the write lock
+            with self._write_lock:
+                delivery_df = self.load_delivery_data()
+                
+                # Create new entry
+                new_date = pd.to_datetime(date)
+                new_entry = pd.DataFrame({
+                    'Date': [new_date],
+                    'Item_Name': [item_name],
+                    'Delivery_Amount': [delivery_amount],
+                    'Notes': [notes]
+                })
+                
+                # Add new entry after every row that sorts at or before it; loaded rows
+                # are ordered by item then date, so the file stays in that order
+                position = int(((delivery_df['Item_Name'] < item_name) |
+                                ((delivery_df['Item_Name'] == item_name) & (delivery_df['Date'] <= new_date))).sum())
+                delivery_df = pd.concat([delivery_df.iloc[:position], new_entry, delivery_df.iloc[position:]], ignore_index=True)
+                
+                # Save
+                self._save_csv(delivery_df, self.delivery_file)
+                
+                # Recalculate everything
+                self.recalculate_all()
+                
+                return True
         except Exception as e:
             print(f"Error adding delivery entry: {e}")
             return False
@@ -456,11 +555,11 @@ if __name__ == "__main__":
     print(f"📊 Calculated consumption for {len(consumption_df)} entries")
     
     print("\n📈 Generating forecasts...")
-    forecast_df = engine.calculate_forecast()
+    forecast_df = engine.calculate_forecast(consumption_df=consumption_df)
     print(f"🔮 Generated forecasts for {len(forecast_df)} items")
     
     print("\n💡 Creating recommendations...")
-    recommendations_df = engine.generate_recommendations()
+    recommendations_df = engine.generate_recommendations(forecast_df=forecast_df)
     print(f"🛒 Generated {len(recommendations_df)} recommendations")
     
     print("\n📋 Current Status:")
@@ -5,13 +5,21 @@ Simplified Inventory Management Web Application
 
 from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
-from inventory_engine import InventoryEngine
+from inventory_engine import InventoryEngine, DELIVERY_ALIASES
+from audit_inventory import make_temp_path
 import json
 import sys
 import os
 import webbrowser
 import threading
+import functools
+from collections import Counter
+import queue
+import shutil
+import codecs
+import uuid
 
 # Resolve base directory so templates and data are found whether running
 # as a normal script or as a PyInstaller bundle
@@ -26,6 +34,263 @@ app.secret_key = 'simple-inventory-2025'
 # Initialize inventory engine
 engine = InventoryEngine(data_dir=os.path.join(base_dir, 'data'))
 
+
+# Forecast columns the analytics page uses; the rest of the file is skipped when parsing
+FORECAST_CHART_COLUMNS = ('Item_Name', 'Current_Stock', 'Unit', 'Min_Threshold', 'Max_Capacity',
+                          'Avg_Daily_Consumption', 'Days_Remaining', 'Runout_Date', 'Confidence',
+                          'Data_Points_Used', 'Chart_Dates', 'Chart_Consumption')
+
+
+@functools.lru_cache(maxsize=4)
+def _compute_current_stocks(current_engine, stock_version, item_info_version):
+    """Build the dashboard's per-item latest stock rows for one version of the data"""
+    stock_df = current_engine.load_stock_data()
+    item_info_df = current_engine.load_item_info()
+    
+    if stock_df.empty or item_info_df.empty:
+        return []
+    
+    # Join each item's latest stock with its info row in one merge
+    # Stock data is sorted by item then date, so each item's last row is its latest
+    latest_stocks = stock_df.drop_duplicates('Item_Name', keep='last')
+    item_details = item_info_df.drop_duplicates('Item_Name')[['Item_Name', 'Unit', 'Min_Threshold']]
+    merged = latest_stocks.merge(item_details, on='Item_Name', how='inner')
+    
+    # Determine status for all items at once
+    below_threshold = merged['Current_Stock'] <= merged['Min_Threshold']
+    getting_low = merged['Current_Stock'] <= merged['Min_Threshold'] * 1.5
+    merged['status_class'] = np.select([below_threshold, getting_low], ['danger', 'warning'], default='success')
+    merged['status_text'] = np.select([below_threshold, getting_low], ['Below Threshold', 'Getting Low'], default='Good')
+    merged['last_updated'] = merged['Date'].dt.strftime('%Y-%m-%d')
+    
+    return merged.rename(columns={
+        'Item_Name': 'item_name',
+        'Current_Stock': 'current_stock',
+        'Unit': 'unit',
+        'Min_Threshold': 'min_threshold'
+    })[['item_name', 'current_stock', 'unit', 'min_threshold', 'status_class', 'status_text', 'last_updated']].to_dict('records')
+
+
+def current_stocks_cached(current_engine):
+    """Latest stock rows, recomputed only when the stock or item info files change"""
+    rows = _compute_current_stocks(current_engine,
+                                   current_engine.file_version(current_engine.stock_file),
+                                   current_engine.file_version(current_engine.item_info_file))
+    return [dict(row) for row in rows]
+
+
+@functools.lru_cache(maxsize=4)
+def _compute_forecast_data(current_engine, forecast_version, stock_version, delivery_version, today):
+    """Build the analytics chart rows for one version of the forecast, stock and delivery files"""
+    # Load stock and delivery data for enhanced charts
+    stock_df = current_engine.load_stock_data()
+    delivery_df = current_engine.load_delivery_data()
+    
+    forecast_data = []
+    forecast_df = current_engine.read_csv_cached(current_engine.forecast_file, usecols=list(FORECAST_CHART_COLUMNS))
+    if forecast_df.empty:
+        return forecast_data
+    
+    # Split the pipe-joined chart columns for all rows up front
+    chart_dates_column = split_pipe_column(forecast_df['Chart_Dates'])
+    chart_consumption_column = split_pipe_column(forecast_df['Chart_Consumption'])
+    
+    # Stock rows for each item
+    stock_by_item = dict(list(stock_df.groupby('Item_Name', sort=False))) if not stock_df.empty else {}
+    
+    for row, chart_dates, consumption_tokens in zip(forecast_df.to_dict('records'), chart_dates_column, chart_consumption_column):
+        item_name = row['Item_Name']
+        
+        # Parse chart data in one numpy conversion - skip blank and NaN entries
+        consumption_values = np.array([x for x in consumption_tokens if x.strip()], dtype=float)
+        chart_consumption = consumption_values[~np.isnan(consumption_values)].tolist()
+        
+        # Get stock levels for the same dates
+        chart_stock_levels = []
+        delivery_markers = []
+        
+        # Chart dates as timestamps, used to look up stock and deliveries by date
+        chart_timestamps = pd.to_datetime(chart_dates)
+        
+        if not stock_df.empty and chart_dates:
+            item_stock_data = stock_by_item.get(item_name)
+            if item_stock_data is not None:
+                # Dates arrive parsed and sorted from load_stock_data; the first reading per date wins
+                stock_by_date = item_stock_data.drop_duplicates('Date').set_index('Date')['Current_Stock']
+                chart_stock_levels = [None if pd.isna(level) else float(level)
+                                      for level in stock_by_date.reindex(chart_timestamps)]
+        
+        # Get delivery information for this item
+        if not delivery_df.empty:
+            # Find deliveries for this item (exact name plus any mapped delivery names)
+            delivery_names = DELIVERY_ALIASES.get(item_name, [item_name])
+            item_deliveries = delivery_df[delivery_df['Item_Name'].isin(delivery_names)]
+            
+            if not item_deliveries.empty:
+                # Create delivery markers for chart dates that have deliveries
+                totals = item_deliveries.groupby('Date')['Delivery_Amount'].sum().reindex(chart_timestamps)
+                for i, (date_str, total_delivery) in enumerate(zip(chart_dates, totals)):
+                    if not pd.isna(total_delivery):
+                        delivery_markers.append({
+                            'x': i,
+                            'amount': float(total_delivery),
+                            'date': date_str
+                        })
+        
+        # Generate 14-day stock level forecast projection
+        forecast_start = chart_timestamps[-1] if chart_dates else pd.Timestamp.now()
+        forecast_dates = pd.date_range(forecast_start + pd.Timedelta(days=1), periods=14, freq='D').strftime('%Y-%m-%d').tolist()
+        # Consumption averages are never negative, so the projection is a
+        # cumulative sum clamped at zero
+        steps = np.full(15, -float(row['Avg_Daily_Consumption']))
+        steps[0] = float(row['Current_Stock'])
+        projected = np.cumsum(steps)[1:].tolist()
+        forecast_stock = [round(value, 1) if value > 0 else 0 for value in projected]
+
+        forecast_data.append({
+            'item_name': str(item_name),
+            'current_stock': float(row['Current_Stock']),
+            'unit': str(row['Unit']),
+            'min_threshold': float(row['Min_Threshold']),
+            'max_capacity': float(row['Max_Capacity']),
+            'avg_daily_consumption': float(row['Avg_Daily_Consumption']),
+            'days_remaining': float(row['Days_Remaining']),
+            'runout_date': str(row['Runout_Date']),
+            'confidence': str(row['Confidence']),
+            'data_points': int(row['Data_Points_Used']),
+            'chart_dates': chart_dates,
+            'chart_consumption': chart_consumption,
+            'chart_stock_levels': chart_stock_levels,
+            'delivery_markers': delivery_markers,
+            'forecast_dates': forecast_dates,
+            'forecast_stock': forecast_stock
+        })
+    
+    return forecast_data
+
+
+def forecast_data_cached(current_engine):
+    """Analytics chart rows, recomputed only when their inputs change or the day rolls over"""
+    rows = _compute_forecast_data(current_engine,
+                                  current_engine.file_version(current_engine.forecast_file),
+                                  current_engine.file_version(current_engine.stock_file),
+                                  current_engine.file_version(current_engine.delivery_file),
+                                  datetime.now().date())
+    return [dict(row) for row in rows]
+
+
+# Post-upload recalculation runs on a single background worker so uploads
+# return immediately; bursts of uploads collapse into one recalculation
+recalc_q = queue.Queue()
+# Queued runs not yet finished and the outcome of the most recent run, reported
+# by /api/recalc_status; only read or changed while holding recalc_state_lock
+recalc_state_lock = threading.Lock()
+recalc_state = {'pending': 0, 'last_finished': None, 'last_error': None}
+
+
+def queue_recalculation(current_engine):
+    """Count a background recalculation as pending and hand it to the worker"""
+    with recalc_state_lock:
+        recalc_state['pending'] += 1
+    recalc_q.put(current_engine)
+
+
+def recalc_worker():
+    """Drain the recalculation queue, running each queued engine once per burst"""
+    while True:
+        pending = [recalc_q.get()]
+        while True:
+            try:
+                pending.append(recalc_q.get_nowait())
+            except queue.Empty:
+                break
+        engines = {id(queued): queued for queued in pending}
+        last_error = None
+        for queued_engine in engines.values():
+            try:
+                queued_engine.recalculate_all()
+                last_error = None
+            except Exception as e:
+                last_error = str(e)
+                print(f"Background recalculation failed: {e}")
+        with recalc_state_lock:
+            recalc_state['pending'] -= len(pending)
+            recalc_state['last_error'] = last_error
+            recalc_state['last_finished'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for _ in pending:
+            recalc_q.task_done()
+
+
+threading.Thread(target=recalc_worker, daemon=True).start()
+
+
+def backup_file(path):
+    """Keep the current version of a file as <path>.backup without copying its bytes"""
+    backup_path = path + '.backup'
+    # Unique link name so concurrent uploads of the same file never collide
+    link_path = f'{backup_path}.{uuid.uuid4().hex}.tmp'
+    try:
+        # A hard link keeps the old contents once the new file is renamed over path
+        os.link(path, link_path)
+        os.replace(link_path, backup_path)
+    except OSError:
+        # Filesystems without hard link support fall back to a full copy, written
+        # under the same unique name and left behind on neither path
+        if os.path.exists(link_path):
+            os.remove(link_path)
+        try:
+            shutil.copy2(path, link_path)
+            os.replace(link_path, backup_path)
+        finally:
+            if os.path.exists(link_path):
+                os.remove(link_path)
+
+
+# Uploadable file types: engine file attribute, required header columns (as
+# bytes so uploads are checked without decoding) and the error shown otherwise
+UPLOAD_TYPES = {
+    'stock_levels': ('stock_file', b'Date,Item_Name,Current_Stock',
+                     'Stock levels CSV must have columns: Date,Item_Name,Current_Stock'),
+    'deliveries': ('delivery_file', b'Date,Item_Name,Delivery_Amount',
+                   'Deliveries CSV must have columns: Date,Item_Name,Delivery_Amount,Notes'),
+    'item_info': ('item_info_file', b'Item_Name,Unit',
+                  'Item info CSV must have columns starting with: Item_Name,Unit'),
+}
+
+# Flash message shown once an upload is saved and its recalculation queued
+MSG_UPLOAD_QUEUED = '✅ Successfully uploaded {kind} data! 📊 Analytics will update in the background shortly.'
+
+
+def read_upload_head(stream, max_lines=2):
+    """Return the first non-blank lines of an uploaded file as bytes, then rewind it"""
+    lines = []
+    for raw_line in stream:
+        line = raw_line.strip()
+        if line:
+            lines.append(line)
+            if len(lines) == max_lines:
+                break
+    stream.seek(0)
+    return lines
+
+
+def is_utf8_file(path, chunk_size=1 << 16):
+    """Check that a saved upload decodes as UTF-8, reading it in chunks"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def split_pipe_column(column):
+    """Split a pipe-joined column into lists, giving [] for empty or NaN cells"""
+    return [parts if parts != [''] else [] for parts in column.fillna('').astype(str).str.split('|')]
+
 @app.route('/')
 def dashboard():
     """Main dashboard showing current status and alerts"""
@@ -36,48 +301,13 @@ def dashboard():
         # Get current status
         status = current_engine.get_current_status()
         
-        # Load current stock levels
-        stock_df = current_engine.load_stock_data()
-        item_info_df = current_engine.load_item_info()
-        
-        current_stocks = []
-        if not stock_df.empty and not item_info_df.empty:
-            latest_stocks = stock_df.groupby('Item_Name').last()
-            
-            for item_name in latest_stocks.index:
-                stock_info = latest_stocks.loc[item_name]
-                item_info = item_info_df[item_info_df['Item_Name'] == item_name]
-                
-                if not item_info.empty:
-                    item_data = item_info.iloc[0]
-                    current_stock = stock_info['Current_Stock']
-                    min_threshold = item_data['Min_Threshold']
-                    
-                    # Determine status
-                    if current_stock <= min_threshold:
-                        status_class = 'danger'
-                        status_text = 'Below Threshold'
-                    elif current_stock <= min_threshold * 1.5:
-                        status_class = 'warning'
-                        status_text = 'Getting Low'
-                    else:
-                        status_class = 'success'
-                        status_text = 'Good'
-                    
-                    current_stocks.append({
-                        'item_name': item_name,
-                        'current_stock': current_stock,
-                        'unit': item_data['Unit'],
-                        'min_threshold': min_threshold,
-                        'status_class': status_class,
-                        'status_text': status_text,
-                        'last_updated': stock_info['Date'].strftime('%Y-%m-%d') if hasattr(stock_info['Date'], 'strftime') else str(stock_info['Date'])
-                    })
+        # Latest stock per item, cached until the underlying CSVs change
+        current_stocks = current_stocks_cached(current_engine)
         
         # Load recommendations
         recommendations = []
         try:
-            recommendations_df = pd.read_csv(current_engine.recommendations_file)
+            recommendations_df = current_engine.read_csv_cached(current_engine.recommendations_file)
             if not recommendations_df.empty:
                 recommendations = recommendations_df.to_dict('records')
         except FileNotFoundError:
@@ -127,112 +357,17 @@ def analytics():
         # Use test engine if in testing mode
         current_engine = app.config.get('engine', engine)
         
-        # Load stock and delivery data for enhanced charts
-        stock_df = current_engine.load_stock_data()
-        delivery_df = current_engine.load_delivery_data()
-        
-        # Load forecast results
+        # Load forecast results, cached until the underlying CSVs change
         forecast_data = []
         try:
-            forecast_df = pd.read_csv(current_engine.forecast_file)
-            if not forecast_df.empty:
-                for _, row in forecast_df.iterrows():
-                    item_name = row['Item_Name']
-                    
-                    # Parse chart data - handle NaN values and convert to string
-                    chart_dates_raw = str(row['Chart_Dates']) if pd.notna(row['Chart_Dates']) else ''
-                    chart_consumption_raw = str(row['Chart_Consumption']) if pd.notna(row['Chart_Consumption']) else ''
-                    
-                    chart_dates = chart_dates_raw.split('|') if chart_dates_raw else []
-                    chart_consumption = [float(x) for x in chart_consumption_raw.split('|') if x.strip() and x.strip().lower() != 'nan'] if chart_consumption_raw else []
-                    
-                    # Get stock levels for the same dates
-                    chart_stock_levels = []
-                    delivery_markers = []
-                    
-                    if not stock_df.empty and chart_dates:
-                        item_stock_data = stock_df[stock_df['Item_Name'] == item_name].copy()
-                        if not item_stock_data.empty:
-                            item_stock_data['Date'] = pd.to_datetime(item_stock_data['Date'])
-                            item_stock_data = item_stock_data.sort_values('Date')
-                            
-                            # Get stock levels for chart dates
-                            for date_str in chart_dates:
-                                date_match = item_stock_data[item_stock_data['Date'] == pd.to_datetime(date_str)]
-                                if not date_match.empty:
-                                    chart_stock_levels.append(float(date_match.iloc[0]['Current_Stock']))
-                                else:
-                                    chart_stock_levels.append(None)
-                    
-                    # Get delivery information for this item
-                    if not delivery_df.empty:
-                        # Apply item name mapping for deliveries
-                        item_mapping = {
-                            'House Blend Coffee': 'Coffee Beans',
-                            'Whole Milk': 'Milk',
-                            '12oz Paper Cups': 'Paper Cups',
-                            'Test Coffee': 'Coffee Beans',
-                            'Test Milk': 'Milk',
-                            'Vanilla Syrup': 'Sugar'
-                        }
-                        
-                        # Find deliveries for this item (with name mapping)
-                        item_deliveries = delivery_df[delivery_df['Item_Name'] == item_name].copy()
-                        for delivery_name, stock_name in item_mapping.items():
-                            if stock_name == item_name:
-                                mapped_deliveries = delivery_df[delivery_df['Item_Name'] == delivery_name].copy()
-                                item_deliveries = pd.concat([item_deliveries, mapped_deliveries], ignore_index=True)
-                        
-                        if not item_deliveries.empty:
-                            item_deliveries['Date'] = pd.to_datetime(item_deliveries['Date'])
-                            
-                            # Create delivery markers for chart dates
-                            for i, date_str in enumerate(chart_dates):
-                                date_deliveries = item_deliveries[item_deliveries['Date'] == pd.to_datetime(date_str)]
-                                if not date_deliveries.empty:
-                                    total_delivery = date_deliveries['Delivery_Amount'].sum()
-                                    delivery_markers.append({
-                                        'x': i,
-                                        'amount': float(total_delivery),
-                                        'date': date_str
-                                    })
-                    
-                    # Generate 14-day stock level forecast projection
-                    forecast_dates = []
-                    forecast_stock = []
-                    forecast_start = pd.to_datetime(chart_dates[-1]) if chart_dates else pd.Timestamp.now()
-                    projected_stock = float(row['Current_Stock'])
-                    avg_consumption = float(row['Avg_Daily_Consumption'])
-                    for day in range(1, 15):
-                        projected_stock = max(0, projected_stock - avg_consumption)
-                        forecast_dates.append((forecast_start + pd.Timedelta(days=day)).strftime('%Y-%m-%d'))
-                        forecast_stock.append(round(projected_stock, 1))
-
-                    forecast_data.append({
-                        'item_name': str(item_name),
-                        'current_stock': float(row['Current_Stock']),
-                        'unit': str(row['Unit']),
-                        'min_threshold': float(row['Min_Threshold']),
-                        'max_capacity': float(row['Max_Capacity']),
-                        'avg_daily_consumption': float(row['Avg_Daily_Consumption']),
-                        'days_remaining': float(row['Days_Remaining']),
-                        'runout_date': str(row['Runout_Date']),
-                        'confidence': str(row['Confidence']),
-                        'data_points': int(row['Data_Points_Used']),
-                        'chart_dates': chart_dates,
-                        'chart_consumption': chart_consumption,
-                        'chart_stock_levels': chart_stock_levels,
-                        'delivery_markers': delivery_markers,
-                        'forecast_dates': forecast_dates,
-                        'forecast_stock': forecast_stock
-                    })
+            forecast_data = forecast_data_cached(current_engine)
         except FileNotFoundError:
             pass
         
         # Load recommendations
         recommendations_data = []
         try:
-            recommendations_df = pd.read_csv(current_engine.recommendations_file)
+            recommendations_df = current_engine.read_csv_cached(current_engine.recommendations_file)
             if not recommendations_df.empty:
                 recommendations_data = recommendations_df.to_dict('records')
         except FileNotFoundError:
@@ -243,9 +378,10 @@ def analytics():
         try:
             item_info_df = current_engine.load_item_info()
             if not item_info_df.empty:
-                # Create a dictionary mapping item names to their info
-                for _, row in item_info_df.iterrows():
-                    item_info_data[row['Item_Name']] = row.to_dict()
+                # Map item names to their info in one pass (the last row wins for duplicates)
+                item_info_data = (item_info_df.drop_duplicates('Item_Name', keep='last')
+                                  .set_index('Item_Name', drop=False)
+                                  .to_dict('index'))
         except FileNotFoundError:
             pass
         
@@ -278,7 +414,7 @@ def audit_results_page():
         item_status = []
         
         try:
-            audit_df = pd.read_csv(current_engine.auditor.audit_results_file)
+            audit_df = current_engine.read_csv_cached(current_engine.auditor.audit_results_file)
             if not audit_df.empty:
                 audit_results = audit_df.to_dict('records')
                 
@@ -289,16 +425,22 @@ def audit_results_page():
                     stock_df = current_engine.load_stock_data()
                     if not stock_df.empty:
                         item_status = stock_df['Item_Name'].unique().tolist()
-                else:
-                    # Group issues by severity; pull unrecorded deliveries into a dedicated table
-                    for result in audit_results:
-                        if result['Issue_Type'] == 'Unrecorded Deliveries':
-                            missing_deliveries_table.append(result)
-                            continue
-                        severity = result['Severity']
-                        if severity not in issues_by_severity:
-                            issues_by_severity[severity] = []
-                        issues_by_severity[severity].append(result)
+                
+                # One pass over the results: tally severities and checked items, group
+                # issues by severity and pull unrecorded deliveries into a dedicated table
+                severity_counts = Counter()
+                checked_items = set()
+                for result in audit_results:
+                    severity = result['Severity']
+                    severity_counts[severity] += 1
+                    if result['Item_Name']:
+                        checked_items.add(result['Item_Name'])
+                    if all_clear:
+                        continue
+                    if result['Issue_Type'] == 'Unrecorded Deliveries':
+                        missing_deliveries_table.append(result)
+                        continue
+                    issues_by_severity.setdefault(severity, []).append(result)
                 
                 # Create audit summary
                 total_issues = len(audit_results) if not all_clear else 0
@@ -306,9 +448,9 @@ def audit_results_page():
                 
                 if all_clear:
                     status = 'Success'
-                elif any(r['Severity'] == 'Critical' for r in audit_results):
+                elif severity_counts['Critical']:
                     status = 'Critical'
-                elif any(r['Severity'] == 'High' for r in audit_results):
+                elif severity_counts['High']:
                     status = 'Warning'
                 else:
                     status = 'Info'
@@ -316,7 +458,7 @@ def audit_results_page():
                 audit_summary = {
                     'last_run': last_run,
                     'total_issues': total_issues,
-                    'items_checked': len(set(r['Item_Name'] for r in audit_results if r['Item_Name'])) or len(item_status),
+                    'items_checked': len(checked_items) or len(item_status),
                     'status': status
                 }
                 
@@ -395,61 +537,44 @@ def upload_csv():
             flash('Please upload a CSV file', 'error')
             return redirect('/upload')
         
-        # Read and validate CSV content
-        content = file.read().decode('utf-8')
-        
-        # Basic validation - check if it has comma separators
-        lines = content.strip().split('\n')
+        # Read only the first lines for validation; the body is streamed to disk below
+        lines = read_upload_head(file.stream)
         if len(lines) < 2:
             flash('CSV file must have at least a header and one data row', 'error')
             return redirect('/upload')
         
         # Save to appropriate file
-        if file_type == 'stock_levels':
-            file_path = current_engine.stock_file
-            # Validate stock levels format
-            if 'Date,Item_Name,Current_Stock' not in lines[0]:
-                flash('Stock levels CSV must have columns: Date,Item_Name,Current_Stock', 'error')
-                return redirect('/upload')
-        elif file_type == 'deliveries':
-            file_path = current_engine.delivery_file
-            # Validate deliveries format
-            if 'Date,Item_Name,Delivery_Amount' not in lines[0]:
-                flash('Deliveries CSV must have columns: Date,Item_Name,Delivery_Amount,Notes', 'error')
-                return redirect('/upload')
-        elif file_type == 'item_info':
-            file_path = current_engine.item_info_file
-            # Validate item info format
-            if 'Item_Name,Unit' not in lines[0]:
-                flash('Item info CSV must have columns starting with: Item_Name,Unit', 'error')
-                return redirect('/upload')
-        else:
+        if file_type not in UPLOAD_TYPES:
             flash('Invalid file type', 'error')
             return redirect('/upload')
+        file_attr, required_header, header_error = UPLOAD_TYPES[file_type]
+        file_path = getattr(current_engine, file_attr)
+        if required_header not in lines[0]:
+            flash(header_error, 'error')
+            return redirect('/upload')
         
-        # Backup existing file
-        import shutil
-        import os
-        if os.path.exists(file_path):
-            backup_path = file_path + '.backup'
-            shutil.copy2(file_path, backup_path)
-        
-        # Save new content
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        
-        # Recalculate everything if it's data that affects analytics
-        if file_type in ['stock_levels', 'deliveries', 'item_info']:
-            # Run all analytics calculations
-            consumption_df = current_engine.calculate_daily_consumption()
-            forecast_df = current_engine.calculate_forecast()
-            recommendations_df = current_engine.generate_recommendations()
-            
-            # Provide detailed feedback on what was updated
-            flash(f'✅ Successfully uploaded {file_type.replace("_", " ")} data!', 'success')
-            flash(f'📊 Auto-updated analytics: {len(consumption_df)} consumption records, {len(forecast_df)} forecasts, {len(recommendations_df)} recommendations', 'success')
-        else:
-            flash(f'✅ Successfully uploaded {file_type.replace("_", " ")} data!', 'success')
+        # Save new content to a temp file and swap it in so readers never see a partial CSV
+        tmp_path = make_temp_path(file_path)
+        try:
+            file.save(tmp_path)
+            # Reject non-UTF-8 uploads (e.g. Excel's default cp1252 export) before they replace live data
+            if not is_utf8_file(tmp_path):
+                os.remove(tmp_path)
+                flash('CSV file must be UTF-8 encoded (in Excel, save as "CSV UTF-8")', 'error')
+                return redirect('/upload')
+            # Backup existing file
+            if os.path.exists(file_path):
+                backup_file(file_path)
+            os.replace(tmp_path, file_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        
+        # Every upload type feeds analytics; the background worker recalculates it
+        queue_recalculation(current_engine)
+        
+        flash(MSG_UPLOAD_QUEUED.format(kind=file_type.replace('_', ' ')), 'success')
         return redirect('/upload')
         
     except Exception as e:
@@ -461,9 +586,7 @@ def recalculate():
     """Manually trigger recalculation"""
     try:
         current_engine = app.config.get('engine', engine)
-        current_engine.calculate_daily_consumption()
-        forecast_df = current_engine.calculate_forecast()
-        recommendations_df = current_engine.generate_recommendations()
+        consumption_df, forecast_df, recommendations_df = current_engine.recalculate_all()
         
         return jsonify({
             'success': True,
@@ -472,12 +595,24 @@ def recalculate():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/recalc_status')
+def recalc_status():
+    """Report whether a background recalculation is still pending"""
+    with recalc_state_lock:
+        state = dict(recalc_state)
+    return jsonify({
+        'success': True,
+        'pending': state['pending'] > 0,
+        'last_finished': state['last_finished'],
+        'last_error': state['last_error']
+    })
+
 @app.route('/api/run_audit', methods=['POST'])
 def run_audit():
     """Manually trigger audit"""
     try:
         current_engine = app.config.get('engine', engine)
-        audit_report = current_engine.auditor.run_audit()
+        audit_report = current_engine.run_audit()
         
         return jsonify({
             'success': True,
@@ -514,5 +649,6 @@ if __name__ == '__main__':
     # Open browser automatically
     open_browser()
     
-    # Start Flask app
-    app.run(debug=True, host='0.0.0.0', port=5000, use_reloader=False)
\ No newline at end of file
+    # Start Flask app; debug mode is opt-in via CAFE_DEBUG=1
+    debug = os.environ.get('CAFE_DEBUG') == '1'
+    app.run(debug=debug, threaded=True, host='0.0.0.0', port=5000, use_reloader=False)
\ No newline at end of file
@@ -11,6 +11,22 @@ import os
 from datetime import datetime, timedelta
 from inventory_engine import InventoryEngine
 
+# Fixture CSVs written into each test's data directory
+STOCK_CSV = """Date,Item_Name,Current_Stock
+2025-08-20,Test Item,10.0
+2025-08-21,Test Item,8.5
+2025-08-22,Test Item,7.0
+2025-08-23,Test Item,15.0
+"""
+
+DELIVERY_CSV = """Date,Item_Name,Delivery_Amount,Notes
+2025-08-23,Test Item,10.0,Weekly delivery
+"""
+
+ITEM_INFO_CSV = """Item_Name,Unit,Min_Threshold,Max_Capacity,Lead_Time_Days,Cost_Per_Unit,Supplier,Notes
+Test Item,units,2.0,20.0,3,5.0,Test Supplier,Test item
+"""
+
 class TestInventoryEngine(unittest.TestCase):
     
     def setUp(self):
@@ -19,37 +35,21 @@ class TestInventoryEngine(unittest.TestCase):
         self.engine = InventoryEngine(data_dir=self.test_dir)
         
         # Create test data files
-        self.create_test_data()
+        self.create_test_data(self.test_dir)
     
     def tearDown(self):
         """Clean up test environment"""
         shutil.rmtree(self.test_dir)
     
-    def create_test_data(self):
+    @staticmethod
+    def create_test_data(data_dir):
         """Create test CSV files"""
-        # Stock levels data
-        stock_data = [
-            ['2025-08-20', 'Test Item', 10.0],
-            ['2025-08-21', 'Test Item', 8.5],
-            ['2025-08-22', 'Test Item', 7.0],
-            ['2025-08-23', 'Test Item', 15.0],  # With delivery
-        ]
-        stock_df = pd.DataFrame(stock_data, columns=['Date', 'Item_Name', 'Current_Stock'])
-        stock_df.to_csv(self.engine.stock_file, index=False)
-        
-        # Deliveries data
-        delivery_data = [
-            ['2025-08-23', 'Test Item', 10.0, 'Weekly delivery']
-        ]
-        delivery_df = pd.DataFrame(delivery_data, columns=['Date', 'Item_Name', 'Delivery_Amount', 'Notes'])
-        delivery_df.to_csv(self.engine.delivery_file, index=False)
-        
-        # Item info data
-        item_data = [
-            ['Test Item', 'units', 2.0, 20.0, 3, 5.0, 'Test Supplier', 'Test item']
-        ]
-        item_df = pd.DataFrame(item_data, columns=['Item_Name', 'Unit', 'Min_Threshold', 'Max_Capacity', 'Lead_Time_Days', 'Cost_Per_Unit', 'Supplier', 'Notes'])
-        item_df.to_csv(self.engine.item_info_file, index=False)
+        # Stock levels (with a delivery on the last day), deliveries and item info
+        for file_name, content in (('daily_stock_levels.csv', STOCK_CSV),
+                                   ('deliveries.csv', DELIVERY_CSV),
+                                   ('item_info.csv', ITEM_INFO_CSV)):
+            with open(os.path.join(data_dir, file_name), 'w') as f:
+                f.write(content)
     
     def test_load_stock_data(self):
         """Test loading stock data"""
@@ -112,6 +112,16 @@ class TestInventoryEngine(unittest.TestCase):
         self.assertGreater(forecast['Avg_Daily_Consumption'], 0)
         self.assertGreater(forecast['Days_Remaining'], 0)
     
+    def test_recalculate_all(self):
+        """Test one-pass recalculation matches the step-by-step results"""
+        consumption_df, forecast_df, recommendations_df = self.engine.recalculate_all()
+        
+        expected_consumption = self.engine.calculate_daily_consumption()
+        self.assertTrue(consumption_df.equals(expected_consumption))
+        self.assertEqual(len(forecast_df), 1)
+        self.assertEqual(forecast_df.iloc[0]['Current_Stock'], 15.0)
+        self.assertTrue(os.path.exists(self.engine.forecast_file))
+    
     def test_generate_recommendations(self):
         """Test recommendation generation"""
         # Set up a scenario where item needs reordering
@@ -146,6 +156,25 @@ class TestInventoryEngine(unittest.TestCase):
         self.assertIn('recommendations_count', status)
         self.assertGreaterEqual(status['total_items'], 0)
     
+    def test_read_csv_cached_keys_on_read_arguments(self):
+        """Test cached reads with different arguments never share a parsed frame"""
+        subset_df = self.engine.read_csv_cached(self.engine.item_info_file, usecols=['Item_Name', 'Unit'])
+        full_df = self.engine.read_csv_cached(self.engine.item_info_file)
+        
+        self.assertEqual(list(subset_df.columns), ['Item_Name', 'Unit'])
+        self.assertIn('Max_Capacity', full_df.columns)
+    
+    def test_get_current_status_refreshes_on_data_change(self):
+        """Test cached status is rebuilt when the stock file changes"""
+        status = self.engine.get_current_status()
+        self.assertEqual(status['total_items'], 1)
+        self.assertEqual(self.engine.get_current_status(), status)
+        
+        stock_df = pd.DataFrame([['2025-08-24', 'Other Item', 4.0]], columns=['Date', 'Item_Name', 'Current_Stock'])
+        stock_df.to_csv(self.engine.stock_file, mode='a', header=False, index=False)
+        
+        self.assertEqual(self.engine.get_current_status()['total_items'], 2)
+    
     
     def test_add_delivery_entry(self):
         """Test adding new delivery entry"""
@@ -163,6 +192,20 @@ class TestInventoryEngine(unittest.TestCase):
         self.assertEqual(new_entry.iloc[0]['Delivery_Amount'], 8.0)
         self.assertEqual(new_entry.iloc[0]['Notes'], 'Test delivery')
     
+    def test_add_delivery_entry_keeps_extra_columns(self):
+        """Test adding a delivery keeps user columns the engine does not use"""
+        with open(self.engine.delivery_file, 'w') as f:
+            f.write("Date,Item_Name,Delivery_Amount,Notes,Invoice_No,Cost\n"
+                    "2025-08-23,Test Item,10.0,Weekly delivery,INV-1,50.0\n")
+        
+        self.assertTrue(self.engine.add_delivery_entry('2025-08-24', 'Test Item', 8.0, 'Test delivery'))
+        
+        delivery_df = pd.read_csv(self.engine.delivery_file)
+        self.assertIn('Invoice_No', delivery_df.columns)
+        self.assertIn('Cost', delivery_df.columns)
+        self.assertEqual(delivery_df.iloc[0]['Invoice_No'], 'INV-1')
+        self.assertEqual(delivery_df.iloc[0]['Cost'], 50.0)
+    
     def test_empty_data_files(self):
         """Test handling of empty data files"""
         # Remove all data files
@@ -8,33 +8,66 @@ import tempfile
 import shutil
 import os
 import json
-from simple_app import app
+import csv
+import threading
+from simple_app import app, recalc_q, queue_recalculation
 from inventory_engine import InventoryEngine
-import pandas as pd
+
+def write_csv(path, header, rows):
+    """Write a small fixture CSV without going through pandas"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+class BlockingEngine:
+    """Engine stand-in whose recalculation waits until the test releases it"""
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+    
+    def recalculate_all(self):
+        self.started.set()
+        self.release.wait(5)
+
+class FailingEngine:
+    """Engine stand-in whose recalculation always raises"""
+    def recalculate_all(self):
+        raise RuntimeError('recalculation failed')
 
 class TestWebApp(unittest.TestCase):
     
-    def setUp(self):
-        """Set up test environment"""
-        self.test_dir = tempfile.mkdtemp()
+    @classmethod
+    def setUpClass(cls):
+        """Build the test data and derived files once for the whole class"""
+        cls.pristine_dir = tempfile.mkdtemp()
+        cls.create_test_data(cls.pristine_dir)
         
         # Create test app with temporary data directory
         app.config['TESTING'] = True
-        self.client = app.test_client()
+        cls.client = app.test_client()
+    
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the pristine data directory"""
+        shutil.rmtree(cls.pristine_dir)
+    
+    def setUp(self):
+        """Set up test environment with a fresh copy of the pristine data"""
+        self.test_dir = tempfile.mkdtemp()
+        shutil.copytree(self.pristine_dir, self.test_dir, dirs_exist_ok=True)
         
         # Replace the global engine with test engine
         global engine
         engine = InventoryEngine(data_dir=self.test_dir)
         app.config['engine'] = engine
-        
-        # Create test data
-        self.create_test_data()
     
     def tearDown(self):
         """Clean up test environment"""
         shutil.rmtree(self.test_dir)
     
-    def create_test_data(self):
+    @staticmethod
+    def create_test_data(data_dir):
         """Create test data files"""
         # Stock levels
         stock_data = [
@@ -45,29 +78,23 @@ class TestWebApp(unittest.TestCase):
             ['2025-08-21', 'Test Coffee', 12.0],
             ['2025-08-22', 'Test Coffee', 9.0],
         ]
-        stock_df = pd.DataFrame(stock_data, columns=['Date', 'Item_Name', 'Current_Stock'])
-        stock_df.to_csv(os.path.join(self.test_dir, 'daily_stock_levels.csv'), index=False)
+        write_csv(os.path.join(data_dir, 'daily_stock_levels.csv'), ['Date', 'Item_Name', 'Current_Stock'], stock_data)
         
         # Deliveries
         delivery_data = [
             ['2025-08-20', 'Test Milk', 20.0, 'Weekly delivery']
         ]
-        delivery_df = pd.DataFrame(delivery_data, columns=['Date', 'Item_Name', 'Delivery_Amount', 'Notes'])
-        delivery_df.to_csv(os.path.join(self.test_dir, 'deliveries.csv'), index=False)
+        write_csv(os.path.join(data_dir, 'deliveries.csv'), ['Date', 'Item_Name', 'Delivery_Amount', 'Notes'], delivery_data)
         
         # Item info
         item_data = [
             ['Test Milk', 'gallons', 3.0, 25.0, 1, 4.50, 'Dairy Co', 'Refrigerated'],
             ['Test Coffee', 'lbs', 2.0, 20.0, 3, 12.00, 'Coffee Co', 'Dry storage']
         ]
-        item_df = pd.DataFrame(item_data, columns=['Item_Name', 'Unit', 'Min_Threshold', 'Max_Capacity', 'Lead_Time_Days', 'Cost_Per_Unit', 'Supplier', 'Notes'])
-        item_df.to_csv(os.path.join(self.test_dir, 'item_info.csv'), index=False)
+        write_csv(os.path.join(data_dir, 'item_info.csv'), ['Item_Name', 'Unit', 'Min_Threshold', 'Max_Capacity', 'Lead_Time_Days', 'Cost_Per_Unit', 'Supplier', 'Notes'], item_data)
         
-        # Generate derived data
-        test_engine = InventoryEngine(data_dir=self.test_dir)
-        test_engine.calculate_daily_consumption()
-        test_engine.calculate_forecast()
-        test_engine.generate_recommendations()
+        # Generate derived data in one pass
+        InventoryEngine(data_dir=data_dir).recalculate_all()
     
     def test_dashboard_loads(self):
         """Test that dashboard loads successfully"""
@@ -121,6 +148,18 @@ class TestWebApp(unittest.TestCase):
         self.assertIn('Added delivery entry', data['message'])
     
     
+    def test_run_audit_api(self):
+        """Test manual audit API writes the audit results"""
+        engine = app.config['engine']
+        os.remove(engine.auditor.audit_results_file)
+        
+        response = self.client.post('/api/run_audit')
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertTrue(data['success'])
+        self.assertTrue(os.path.exists(engine.auditor.audit_results_file))
+    
     def test_recalculate_api(self):
         """Test manual recalculation API"""
         response = self.client.post('/api/recalculate')
@@ -130,20 +169,93 @@ class TestWebApp(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertIn('Recalculated', data['message'])
     
+    def test_recalc_status_tracks_queued_run(self):
+        """Test recalc status reports a queued run while pending and once finished"""
+        blocking_engine = BlockingEngine()
+        queue_recalculation(blocking_engine)
+        self.assertTrue(blocking_engine.started.wait(5))
+        
+        data = json.loads(self.client.get('/api/recalc_status').data)
+        self.assertTrue(data['pending'])
+        
+        blocking_engine.release.set()
+        recalc_q.join()
+        data = json.loads(self.client.get('/api/recalc_status').data)
+        self.assertFalse(data['pending'])
+        self.assertIsNotNone(data['last_finished'])
+        self.assertIsNone(data['last_error'])
+    
+    def test_recalc_status_reports_error(self):
+        """Test recalc status reports the error from a failed background run"""
+        queue_recalculation(FailingEngine())
+        recalc_q.join()
+        
+        data = json.loads(self.client.get('/api/recalc_status').data)
+        self.assertFalse(data['pending'])
+        self.assertIsNotNone(data['last_finished'])
+        self.assertEqual(data['last_error'], 'recalculation failed')
+    
+    def upload_csv(self, content, file_type):
+        """Post raw CSV bytes to the upload endpoint"""
+        return self.client.post('/api/upload_csv',
+                                data={
+                                    'csv_file': (io.BytesIO(content), 'test.csv'),
+                                    'file_type': file_type
+                                })
+    
     def test_upload_csv_stock_levels(self):
         """Test CSV upload for stock levels"""
-        csv_content = """Date,Item_Name,Current_Stock
+        csv_content = b"""Date,Item_Name,Current_Stock
+2025-08-20,Test Milk,10.0
 2025-08-24,Test Milk,20.0
-2025-08-24,Test Coffee,15.0"""
+2025-08-24,Test Coffee,15.0
+"""
+        engine = app.config['engine']
+        with open(engine.stock_file, 'rb') as f:
+            old_content = f.read()
+        
+        response = self.upload_csv(csv_content, 'stock_levels')
+        self.assertEqual(response.status_code, 302)
+        
+        # The live file is replaced and the old version kept as a backup
+        with open(engine.stock_file, 'rb') as f:
+            self.assertEqual(f.read(), csv_content)
+        with open(engine.stock_file + '.backup', 'rb') as f:
+            self.assertEqual(f.read(), old_content)
+        
+        # The queued background recalculation regenerates the derived files
+        recalc_q.join()
+        with open(engine.consumption_file) as f:
+            consumption = f.read()
+        self.assertIn('2025-08-24', consumption)
+        self.assertNotIn('2025-08-21', consumption)
+    
+    def test_upload_csv_bad_header_keeps_live_file(self):
+        """Test an upload with the wrong columns leaves the live file untouched"""
+        engine = app.config['engine']
+        with open(engine.stock_file, 'rb') as f:
+            old_content = f.read()
+        
+        response = self.upload_csv(b"Day,Item,Stock\n2025-08-24,Test Milk,20.0\n", 'stock_levels')
+        self.assertEqual(response.status_code, 302)
+        
+        with open(engine.stock_file, 'rb') as f:
+            self.assertEqual(f.read(), old_content)
+        self.assertFalse(os.path.exists(engine.stock_file + '.backup'))
+    
+    def test_upload_csv_bad_encoding_keeps_live_file(self):
+        """Test a non-UTF-8 upload leaves the live file untouched"""
+        engine = app.config['engine']
+        with open(engine.delivery_file, 'rb') as f:
+            old_content = f.read()
         
-        response = self.client.post('/api/upload_csv',
-                                  data={
-                                      'file': (io.BytesIO(csv_content.encode()), 'test.csv'),
-                                      'file_type': 'stock_levels'
-                                  })
+        csv_content = b"Date,Item_Name,Delivery_Amount,Notes\n2025-08-24,Test Milk,5.0,Caf\xe9 \xff\xfe\n"
+        response = self.upload_csv(csv_content, 'deliveries')
+        self.assertEqual(response.status_code, 302)
         
-        # Note: This test might need adjustment based on actual file upload handling
-        # The current implementation expects actual file objects
+        with open(engine.delivery_file, 'rb') as f:
+            self.assertEqual(f.read(), old_content)
+        self.assertEqual([name for name in os.listdir(self.test_dir) if name.endswith('.tmp')], [])
     
     def test_error_handling(self):
         """Test error handling for invalid requests"""